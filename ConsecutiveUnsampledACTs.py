@@ -2,8 +2,9 @@ from decimal        import *
 from tqdm           import tqdm
 from utils          import InclusiveRange
 from KHeadsInARow   import *
+from Profiler       import Profiler
 
-def pUnsampledConsecutiveACTs(N, TH, p, MEMORY_OPTIMIZED):
+def pUnsampledConsecutiveACTs(N, TH, p, MEMORY_OPTIMIZED, profiler=None):
     '''
     Computes probability of TH consecutive unsampled ACTs recursively.
         All this code implements the formula from DRAMSec 2022 paper titled
@@ -13,6 +14,7 @@ def pUnsampledConsecutiveACTs(N, TH, p, MEMORY_OPTIMIZED):
     :param Decimal p: probability of sampling a row ACT
     :param dram: dram config (namedtuple)
     :param MEMORY_OPTIMIZED: run a slower, but more memory-efficient version of the algorithm
+    :param Profiler profiler: if set, samples the progress of the recurrence (default: None)
     :rtype: Decimal
     :raise ValueError: if N and TH are less or equal than 0
     :raise TypeError: if parameters have incorrect types
@@ -37,7 +39,11 @@ def pUnsampledConsecutiveACTs(N, TH, p, MEMORY_OPTIMIZED):
             P = [0 for i in InclusiveRange(0,N)]
             P[TH] = qToTheTH
 
-            for nIdx in tqdm(InclusiveRange(TH, N - 1)):
+            steps = tqdm(InclusiveRange(TH, N - 1))
+            if profiler is not None and profiler.enabled:
+                steps = profiler.Track('recurrence', steps, N - TH, P)
+
+            for nIdx in steps:
                 P[nIdx + 1] = P[nIdx] + pTimesqToTheTH * (Decimal('1.0') - P[nIdx-TH])
 
             return P[N]
@@ -48,7 +54,11 @@ def pUnsampledConsecutiveACTs(N, TH, p, MEMORY_OPTIMIZED):
             P.append(qToTheTH)
 
             prev = qToTheTH
-            for i in tqdm(InclusiveRange(TH, N-1)):
+            steps = tqdm(InclusiveRange(TH, N-1))
+            if profiler is not None and profiler.enabled:
+                steps = profiler.Track('recurrence', steps, N - TH, P)
+
+            for i in steps:
                 prev = prev + pTimesqToTheTH * (Decimal('1.0') - P.pop(0))
                 P.append(prev)
 
@@ -103,5 +113,24 @@ if __name__ == '__main__':
         print("Test 4 failed")
         testsPassed = False   
 
+    # Test 5
+    # Profiling the recurrence does not change its result and records its samples and window size
+    for memoryOptimized in [0, 1]:
+        profiler = Profiler(period=0.0, check=1)
+        if (pUnsampledConsecutiveACTs(1000, 256, pUnfairCoin, memoryOptimized, profiler) !=
+                pUnsampledConsecutiveACTs(1000, 256, pUnfairCoin, memoryOptimized) or
+            not any('recurrence' == sample['stage'] for sample in profiler.samples) or
+            profiler.windows.get('recurrence', 0) <= 0):
+            print("Test 5 failed")
+            testsPassed = False
+
+        # A disabled profiler leaves the recurrence untouched
+        profiler = Profiler(enabled=False)
+        if (pUnsampledConsecutiveACTs(1000, 256, pUnfairCoin, memoryOptimized, profiler) !=
+                pUnsampledConsecutiveACTs(1000, 256, pUnfairCoin, memoryOptimized) or
+            profiler.samples != [] or profiler.windows != {}):
+            print("Test 5 failed")
+            testsPassed = False
+
     if(testsPassed):
         print("Success!")
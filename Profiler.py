@@ -0,0 +1,396 @@
+from contextlib     import contextmanager, nullcontext
+from decimal        import *
+from sys            import getsizeof
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows
+    resource = None
+
+class Profiler:
+    '''
+    Opt-in instrumentation for the stages of an RH failure computation.
+        Records per-stage wall and CPU time, the Decimal flags raised in each stage,
+        steps/sec samples of long-running loops, and the peak size of their windows.
+        A disabled profiler hands out no-op stages and leaves loops untouched,
+        so the instrumentation costs nothing when it is not requested.
+    '''
+
+    def __init__(self, enabled=True, period=1.0, backoff=2.0, ceiling=600.0, keep=256, check=4096):
+        '''
+        :param bool enabled: record measurements (a disabled profiler is a no-op)
+        :param float period: number of seconds before the first steps/sec sample of a loop
+        :param float backoff: factor the period grows by after each sample
+        :param float ceiling: maximum number of seconds between two steps/sec samples
+        :param int keep: maximum number of samples kept (older samples are thinned out beyond that)
+        :param int check: number of loop steps between two clock reads
+        '''
+
+        self.enabled = enabled
+        self.period  = period
+        self.backoff = backoff
+        self.ceiling = ceiling
+        self.keep    = keep
+        self.check   = check
+        self.stages  = []
+        self.samples = []
+        self.windows = {}
+        self.finals  = {}
+        self.points  = []
+
+    def Stage(self, name, decimal=True):
+        '''
+        Returns a context manager measuring the stage called name
+
+        :param str name: name of the stage
+        :param bool decimal: record the Decimal precision and flags (False for integer-only stages)
+        '''
+
+        if not self.enabled:
+            return nullcontext()
+        return self._Stage(name, decimal)
+
+    @contextmanager
+    def _Stage(self, name, decimal):
+        # Clear the flags so that we only report the ones raised by this stage,
+        # then put back the flags that were set before the stage started
+        context = getcontext()
+        saved   = [signal for signal, isSet in context.flags.items() if isSet]
+        context.clear_flags()
+
+        wall = time.perf_counter()
+        cpu  = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu  = time.process_time() - cpu
+
+            flags = [signal.__name__ for signal, isSet in context.flags.items() if isSet]
+            for signal in saved:
+                context.flags[signal] = True
+
+            stage = {
+                'name':           name,
+                'wall_s':         wall,
+                'cpu_s':          cpu,
+            }
+            if decimal:
+                stage['decimal_flags'] = sorted(flags)
+                stage['precision']     = context.prec
+            self.stages.append(stage)
+
+    def Track(self, stage, steps, total, window):
+        '''
+        Wraps the iterable steps of a loop and samples its progress over time.
+            The time between two samples grows geometrically (up to ceiling), so long runs record few samples.
+            If steps is a tqdm progress bar, the samples are shown in its postfix.
+
+        :param str stage: name of the stage running the loop
+        :param steps: iterable driving the loop
+        :param int total: number of steps in the loop
+        :param list window: list structure updated by the loop (sized at each sample)
+        :rtype: generator
+        '''
+
+        period = self.period
+        check  = self.check
+        start  = time.perf_counter()
+        last   = start
+        done   = 0
+
+        for done, step in enumerate(steps, 1):
+            if 0 == done % check:
+                now = time.perf_counter()
+                if now - last >= period:
+                    last   = now
+                    period = min(period * self.backoff, self.ceiling)
+                    self._Sample(stage, now - start, done, total, window)
+                    if hasattr(steps, 'set_postfix_str'):
+                        steps.set_postfix_str('window {:.1f}MB'.format(self.windows[stage] / 1024 / 1024), refresh=False)
+            yield step
+
+        elapsed = time.perf_counter() - start
+        self._Sample(stage, elapsed, done, total, window)
+        self.finals[stage] = (done, elapsed)
+
+    def _Sample(self, stage, elapsed, done, total, window):
+        rate = done / elapsed if elapsed > 0 else 0.0
+        self.samples.append({
+            'stage':          stage,
+            'elapsed_s':      elapsed,
+            'step':           done,
+            'steps_per_s':    rate,
+            'eta_s':          (total - done) / rate if rate > 0 else None,
+        })
+        self.windows[stage] = max(self.windows.get(stage, 0), WindowBytes(window))
+
+        # Thin out every other sample (keeping the latest) once we hold more than keep samples
+        if len(self.samples) > self.keep:
+            self.samples = self.samples[-1::-2][::-1]
+
+    def Calibrate(self, run, ths, steps):
+        '''
+        Measures the cost of a step of the recurrence for different thresholds
+
+        :param run: callable running the recurrence, as run(N, TH)
+        :param ths: thresholds to measure
+        :param int steps: number of steps to run for each threshold
+        '''
+
+        if not self.enabled:
+            return
+        for TH in ths:
+            start = time.perf_counter()
+            run(TH + steps, TH)
+            self.points.append((TH, (time.perf_counter() - start) / steps))
+
+    def Report(self, N, TH, MEMORY_OPTIMIZED, config, results):
+        '''
+        Returns the measurements as a JSON-serializable dict
+
+        The ETA model is a CostModel fitted on the calibration points and on the recurrence of this run.
+        It estimates the time of the recurrence for other N and TH at the same precision and memory mode.
+
+        :param int N: number of row activations
+        :param int TH: Rowhammer threshold
+        :param MEMORY_OPTIMIZED: memory mode of the recurrence
+        :param dict config: configuration of the run, copied into the report
+        :param dict results: results of the run, copied into the report
+        :rtype: dict
+        '''
+
+        points = list(self.points)
+        measured = None
+        if 'recurrence' in self.finals:
+            done, measured = self.finals['recurrence']
+            if done > 0:
+                points.append((TH, measured / done))
+        model = CostModel(getcontext().prec, MEMORY_OPTIMIZED, points)
+
+        report = {
+            'config':               config,
+            'results':              results,
+            'precision':            getcontext().prec,
+            'stages':               self.stages,
+            'samples':              self.samples,
+            'peak_window_bytes':    self.windows,
+            'peak_rss_bytes':       PeakRSS(),
+            'eta': {
+                'steps':                max(N - TH, 0),
+                'measured_s':           measured,
+                'estimated_s':          model.Estimate(N, TH),
+                'cost_model':           model.Dict(),
+            },
+        }
+        return report
+
+class CostModel:
+    '''
+    Cost model of the recurrence, which runs N - TH steps.
+        In the memory-optimized version, each step pops the head of a TH-long list,
+        so a step costs a + b * TH seconds. Otherwise, a step costs a constant a seconds.
+        The coefficients are only valid for the precision they were measured with.
+    '''
+
+    def __init__(self, precision, MEMORY_OPTIMIZED, points):
+        '''
+        Fits the model with least squares
+
+        :param int precision: precision of the computation the points were measured with
+        :param MEMORY_OPTIMIZED: memory mode of the recurrence
+        :param points: list of (TH, seconds per step) measurements
+        '''
+
+        self.precision = precision
+        self.memoryOptimized = MEMORY_OPTIMIZED
+        self.points = points
+        self.a = None
+        self.b = 0.0
+
+        if len(points) == 0:
+            return
+
+        meanTH = sum(th for th, _ in points) / len(points)
+        meanS  = sum(s for _, s in points) / len(points)
+        varTH  = sum((th - meanTH) ** 2 for th, _ in points)
+        if 0 != MEMORY_OPTIMIZED and varTH > 0:
+            self.b = sum((th - meanTH) * (s - meanS) for th, s in points) / varTH
+        self.a = meanS - self.b * meanTH
+
+    def SecondsPerStep(self, TH):
+        '''
+        Returns the estimated cost (in seconds) of a step of the recurrence, or None if the model has no points
+        '''
+
+        if self.a is None:
+            return None
+        return max(self.a + self.b * TH, 0.0)
+
+    def Estimate(self, N, TH):
+        '''
+        Returns the estimated time (in seconds) of the recurrence for N and TH, or None if the model has no points
+        '''
+
+        perStep = self.SecondsPerStep(TH)
+        if perStep is None:
+            return None
+        return max(N - TH, 0) * perStep
+
+    def Dict(self):
+        '''
+        Returns the model as a JSON-serializable dict
+        '''
+
+        return {
+            'precision':            self.precision,
+            'memory_optimized':     self.memoryOptimized,
+            'a_s':                  self.a,
+            'b_s':                  self.b,
+            'formula':              'estimated_s = (N - TH) * (a_s + b_s * TH)',
+            'points':               [{'th': th, 'seconds_per_step': s} for th, s in self.points],
+        }
+
+def WindowBytes(window):
+    '''
+    Estimates the memory footprint (in bytes) of a list and the objects it holds.
+        Large lists are sized from a strided sample of at most 1024 elements.
+
+    :param list window: list to size
+    :rtype: int
+    '''
+
+    size = getsizeof(window)
+    if len(window) == 0:
+        return size
+
+    stride = max(len(window) // 1024, 1)
+    sample = window[::stride]
+    return size + sum(getsizeof(x) for x in sample) * len(window) // len(sample)
+
+def PeakRSS():
+    '''
+    Returns the peak resident set size of the process (in bytes), or None if unknown
+    '''
+
+    if resource is None:
+        return None
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if 'darwin' == sys.platform else rss * 1024
+
+def PrintReport(report, fmt, file=None):
+    '''
+    Prints a report as returned by Profiler.Report in the text or json format
+
+    :param dict report: report to print
+    :param str fmt: text/json
+    :param file: stream to print to (default: stdout)
+    '''
+
+    if 'json' == fmt:
+        print(json.dumps(report, indent=2), file=file)
+        return
+
+    print('\nProfile (precision: {}):'.format(report['precision']), file=file)
+    for stage in report['stages']:
+        flags = (', '.join(stage['decimal_flags']) or '-') if 'decimal_flags' in stage else 'n/a'
+        print('  {:<16} wall {:>10.3f}s  cpu {:>10.3f}s  flags: {}'.format(
+            stage['name'], stage['wall_s'], stage['cpu_s'], flags), file=file)
+    for stage, size in report['peak_window_bytes'].items():
+        print('  Peak window size ({}): {:.2f} MB'.format(stage, size / 1024 / 1024), file=file)
+    if report['peak_rss_bytes'] is not None:
+        print('  Peak RSS: {:.2f} MB'.format(report['peak_rss_bytes'] / 1024 / 1024), file=file)
+
+    eta   = report['eta']
+    model = eta['cost_model']
+    if eta['measured_s'] is not None:
+        print('  Recurrence: {} steps, measured {:.1f}s'.format(eta['steps'], eta['measured_s']), file=file)
+    if model['a_s'] is not None:
+        print('  Cost model (precision {}, memory optimized {}): (N - TH) * ({:.3e} + {:.3e} * TH) s, estimated {:.1f}s'.format(
+            model['precision'], model['memory_optimized'], model['a_s'], model['b_s'], eta['estimated_s']), file=file)
+
+# Main is used for testing only
+if __name__ == '__main__':
+    testsPassed = True
+
+    context = Context(prec=10, traps=[Overflow, Underflow, FloatOperation])
+    setcontext(context)
+
+    # Test 1
+    # A disabled profiler records nothing and leaves loops untouched
+    profiler = Profiler(enabled=False)
+    with profiler.Stage('disabled'):
+        Decimal(1) / Decimal(3)
+    if (profiler.stages != [] or profiler.samples != []):
+        print("Test 1 failed")
+        testsPassed = False
+
+    # Test 2
+    # Flags are reported per stage and the flags set before the stage are restored
+    profiler = Profiler()
+    context.clear_flags()
+    context.flags[Clamped] = True
+    with profiler.Stage('exact'):
+        Decimal(1) / Decimal(4)
+    with profiler.Stage('inexact'):
+        Decimal(1) / Decimal(3)
+    with profiler.Stage('integer', decimal=False):
+        1 // 3
+    if (profiler.stages[0]['decimal_flags'] != [] or
+        profiler.stages[1]['decimal_flags'] != ['Inexact', 'Rounded'] or
+        profiler.stages[1]['precision'] != 10 or 'precision' in profiler.stages[2] or
+        not context.flags[Clamped] or not context.flags[Inexact]):
+        print("Test 2 failed")
+        testsPassed = False
+
+    # Test 3
+    # Tracking a loop yields every step and always records a final sample
+    profiler = Profiler(period=0.0, check=10)
+    window = [Decimal(1)] * 10
+    if (list(profiler.Track('loop', range(100), 100, window)) != list(range(100)) or
+        len(profiler.samples) != 11 or profiler.samples[-1]['step'] != 100 or
+        profiler.windows['loop'] < getsizeof(window)):
+        print("Test 3 failed")
+        testsPassed = False
+
+    # Test 4
+    # The report is JSON-serializable and carries the measured time of the recurrence
+    profiler.finals['recurrence'] = (900, 9.0)
+    report = json.loads(json.dumps(profiler.Report(1000, 100, 1, {'cfg': 'test'}, {'result': '0.5'})))
+    if (report['eta']['steps'] != 900 or report['eta']['measured_s'] != 9.0 or
+        report['eta']['cost_model']['precision'] != 10 or report['results']['result'] != '0.5'):
+        print("Test 4 failed")
+        testsPassed = False
+
+    # Test 5
+    # The cost model grows with TH in the memory-optimized version and predicts other (N, TH) pairs
+    model = CostModel(10, 1, [(1000, 3e-6), (3000, 5e-6)])
+    if (abs(model.a - 2e-6) > 1e-12 or abs(model.b - 1e-9) > 1e-15 or
+        abs(model.Estimate(10000, 2000) - 8000 * 4e-6) > 1e-9):
+        print("Test 5 failed")
+        testsPassed = False
+
+    # Test 6
+    # The cost model is a constant in the full-list version
+    model = CostModel(10, 0, [(1000, 3e-6), (3000, 5e-6)])
+    if (model.b != 0.0 or abs(model.Estimate(10000, 2000) - 8000 * 4e-6) > 1e-9 or
+        CostModel(10, 1, []).Estimate(10000, 2000) is not None):
+        print("Test 6 failed")
+        testsPassed = False
+
+    # Test 7
+    # Samples are thinned out beyond keep, keeping the latest one
+    profiler = Profiler(period=0.0, check=1, keep=8)
+    for i in profiler.Track('loop', range(100), 100, []):
+        pass
+    if (len(profiler.samples) > 8 or profiler.samples[-1]['step'] != 100):
+        print("Test 7 failed")
+        testsPassed = False
+
+    if(testsPassed):
+        print("Success!")
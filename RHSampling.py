@@ -6,6 +6,7 @@ from utils                      import *
 from KHeadsInARow               import *
 from ConsecutiveUnsampledACTs   import *
 from UnrefreshedRow             import *
+from Profiler                   import Profiler, PrintReport
 
    
 # Some of our code is memory intensive and it might run out of memory. In that case set MEMORY_OPTIMIZED to 1
@@ -28,13 +29,25 @@ if __name__ == '__main__':
     parser.add_argument("--th",   metavar='th',     type=int, default=8192,     help="Rowhammer threshold                   (default: %(default)s)")
     parser.add_argument("--rate", metavar='p',      type=Decimal,required=True, help="Sampling rate (required)              (no default value)")
     parser.add_argument("--prec", metavar="prec",   type=int, default=100,      help="Precision of computation              (default: %(default)s)")
+    parser.add_argument("--profile", action='store_true',                       help="Time each stage of the computation    (default: %(default)s)")
+    parser.add_argument("--report", metavar='fmt',  type=str, default=None,     help="text/json profile report format       (default: text)", choices = ['text', 'json'])
+    parser.add_argument("--report-file", metavar='file', type=str, default=None, help="Write the profile report to file       (default: stdout, required for json)")
     args = parser.parse_args()
+    if not args.profile and (args.report is not None or args.report_file is not None):
+        parser.error('--report and --report-file require --profile')
+    if args.report is None:
+        args.report = 'text'
+    if 'json' == args.report and args.report_file is None:
+        parser.error('--report json requires --report-file (stdout carries the plain-text output)')
     cfg  = args.cfg
     lt   = args.lt
     th   = args.th
     p    = args.rate
     prec = args.prec
 
+    # The profiler is a no-op unless --profile is given
+    profiler = Profiler(enabled=args.profile)
+
     print('System lifetime (hours): {}'.format(lt))
     print('Rowhammer threshold: {}'.format(th))
     
@@ -75,9 +88,11 @@ if __name__ == '__main__':
     # Compute window: number of row activations in system's lifetime
     # We use the integer division operator ('//') to avoid W from being converted to a float
     # These divisions should not have any remainders (pls. double check dram config)
-    W  = (ddr.tRFW - (ddr.tRFC * ddr.cREF)) // ddr.tRC      # W in a refresh window
-    W *= 3600 // (ddr.tRFW // 1000 // 1000)                 # W in an hour
-    W *= lt                                                 # W in lifetime
+    # W is integer arithmetic computed before we set up the Decimal context, so we do not record precision or flags
+    with profiler.Stage('W', decimal=False):
+        W  = (ddr.tRFW - (ddr.tRFC * ddr.cREF)) // ddr.tRC      # W in a refresh window
+        W *= 3600 // (ddr.tRFW // 1000 // 1000)                 # W in an hour
+        W *= lt                                                 # W in lifetime
 
     print('Total # of banks: {}'.format(Banks(host, dram)))
     print('Approx # of ACTs in attack\'s lifetime (in billions): ~{:.2f}'.format(W / 1000 / 1000 / 1000))
@@ -96,18 +111,37 @@ if __name__ == '__main__':
     #prob_no_sampling = kHeadsInARow(W, th, Decimal('1.0') - p)
 
     # 2/ Using the unsampled ACTs algorithm
-    prob_no_sampling = pUnsampledConsecutiveACTs(W, th, p, MEMORY_OPTIMIZED)
+    with profiler.Stage('recurrence'):
+        prob_no_sampling = pUnsampledConsecutiveACTs(W, th, p, MEMORY_OPTIMIZED, profiler)
     # print('Probability of consecutive ACTs escaping sampling : {}'.format(format_e(prob_no_sampling)))
 
     # Compute the probability of a victim row escaping refreshing
-    prob_no_refresh = PUnrefreshedRow(th, ddr.tRC, ddr.tRFW)
+    with profiler.Stage('PUnrefreshedRow'):
+        prob_no_refresh = PUnrefreshedRow(th, ddr.tRC, ddr.tRFW)
     # print('Probability of victim row escaping refresh : {}'.format(format_e(prob_no_refresh)))
 
     # Compute probability of RH failure all banks in a system
     banks = Banks(host, dram)
-    prob_rh_fail = Decimal('1.0') - (Decimal('1.0') - prob_no_sampling * prob_no_refresh) ** banks
+    with profiler.Stage('banks'):
+        prob_rh_fail = Decimal('1.0') - (Decimal('1.0') - prob_no_sampling * prob_no_refresh) ** banks
     print('\nProbability of RH failure in a system with {} banks: {}'.format(banks, format_e(prob_rh_fail)))
 
+    # Report per-stage timings, Decimal flags, memory and an ETA model for the recurrence
+    if profiler.enabled:
+        # Calibrate the cost model of the recurrence on a few thresholds, so it can estimate runs with other N and TH
+        with profiler.Stage('calibration'):
+            profiler.Calibrate(lambda n, t: pUnsampledConsecutiveACTs(n, t, p, MEMORY_OPTIMIZED), [1024, 16384], 20000)
+
+        config  = {'cfg': cfg, 'lt': lt, 'th': th, 'rate': str(p), 'banks': banks, 'W': W}
+        results = {'prob_no_sampling': str(prob_no_sampling), 'prob_no_refresh': str(prob_no_refresh),
+                   'prob_rh_fail': str(prob_rh_fail)}
+        report  = profiler.Report(W, th, MEMORY_OPTIMIZED, config, results)
+        if args.report_file is None:
+            PrintReport(report, args.report)
+        else:
+            with open(args.report_file, 'w') as file:
+                PrintReport(report, args.report, file)
+
     # Given the nature of the computations above, the results are always inexact and rounded. 
     # Showing a warning for an event that always occurs is a little silly.
     # Comment out these warnings 